@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Adaptive polling schedule and deadband / swinging door compression
+# of recorded series.
+#
+import os
+import json
+import time
+import datetime
+import logging
+
+STORE_INTERVAL = 3600 # seconds, a record is stored at least once in this period
+
+def parseTime(s):
+    # rec_*.py write '%Y/%m/%d %H:%M:%S', BTWATTCH2 gives str(datetime)
+    for fmt in ('%Y/%m/%d %H:%M:%S', '%Y-%m-%d %H:%M:%S'):
+        try:
+            return datetime.datetime.strptime(s, fmt).timestamp()
+        except (ValueError, TypeError):
+            pass
+    return time.time()
+
+def readConf(conf):
+    # Each line is '<id> <field> <deviation> [door|deadband]'.
+    # id '*' applies to any series.
+    deviations = {}
+    if not os.path.exists(conf):
+        return deviations
+    with open(conf, 'r') as fd:
+        lines = fd.readlines()
+    for line in lines:
+        if line.startswith('#'):
+            continue
+        args = line.strip().split()
+        if len(args) < 3:
+            continue
+        mode = 'door'
+        if len(args) >= 4:
+            mode = args[3]
+        if not mode in ('door', 'deadband'):
+            logging.error('%s: unknown mode, skipped: %s' % (conf, line.strip()))
+            continue
+        try:
+            dev = float(args[2])
+        except ValueError:
+            dev = -1
+        if not dev >= 0:
+            logging.error('%s: bad deviation, skipped: %s' % (conf, line.strip()))
+            continue
+        deviations[(args[0], args[1])] = (dev, mode)
+    return deviations
+
+def fieldDeviation(deviations, id, field):
+    if (id, field) in deviations:
+        return deviations[(id, field)]
+    return deviations.get(('*', field))
+
+def numericFields(deviations, rec):
+    fields = []
+    for (field, value) in rec.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        if fieldDeviation(deviations, rec.get('id'), field) is None:
+            continue
+        fields.append(field)
+    return sorted(fields)
+
+class Compressor:
+
+    def __init__(self, deviations, maxInterval=STORE_INTERVAL):
+        self.deviations = deviations
+        self.maxInterval = maxInterval # store at least once in this period
+        self.series = {}
+
+    def load(self, fname):
+        if not os.path.exists(fname):
+            return
+        try:
+            with open(fname, 'r') as fd:
+                self.series = json.load(fd)
+        except ValueError as e:
+            logging.error('compress state broken, %s' % (e))
+            self.series = {}
+
+    def save(self, fname):
+        with open(fname, 'w') as fd:
+            json.dump(self.series, fd)
+
+    def openDoors(self, st, rec, fields):
+        # returns True if the swinging door of any field is opened by rec,
+        # ie. the line from anchor to rec doesn't pass within deviation
+        # of the points since anchor.
+        anchor = st['anchor']
+        dt = parseTime(rec['time']) - parseTime(anchor['time'])
+        opened = False
+        for field in fields:
+            (dev, mode) = fieldDeviation(self.deviations, rec.get('id'), field)
+            if mode != 'door':
+                continue
+            dv = rec[field] - anchor[field]
+            if dt <= 0:
+                if abs(dv) > dev:
+                    opened = True
+                continue
+            (upper, lower) = st['doors'].get(field, (None, None))
+            slope = dv / dt
+            if not upper is None and (slope < upper or slope > lower):
+                opened = True
+            slope = (dv - dev) / dt
+            if upper is None or slope > upper:
+                upper = slope
+            slope = (dv + dev) / dt
+            if lower is None or slope < lower:
+                lower = slope
+            st['doors'][field] = (upper, lower)
+        return opened
+
+    def outOfBand(self, st, rec, fields):
+        anchor = st['anchor']
+        for field in fields:
+            (dev, mode) = fieldDeviation(self.deviations, rec.get('id'), field)
+            if mode != 'deadband':
+                continue
+            if abs(rec[field] - anchor[field]) > dev:
+                return True
+        return False
+
+    def othersChanged(self, st, rec, fields):
+        # discrete fields without deviation (counters, levels like kwh or
+        # battery) are stored whenever they change. Measured floats
+        # without deviation (eg. a_t, a_r) just follow the stored records.
+        anchor = st['anchor']
+        for (field, value) in rec.items():
+            if isinstance(value, bool) or not isinstance(value, int):
+                continue
+            if field in fields:
+                continue
+            if anchor.get(field) != value:
+                return True
+        return False
+
+    def add(self, rec):
+        # returns the list of records to be stored
+        fields = numericFields(self.deviations, rec)
+        if not rec.get('done') or rec.get('inf') or len(fields) <= 0:
+            return [rec]
+        rec = dict(rec)
+        key = '%s/%s/%s' % (rec.get('id'), rec.get('type'), rec.get('mac'))
+        st = self.series.get(key)
+        if st is None or numericFields(self.deviations, st['anchor']) != fields:
+            stored = []
+            if not st is None and not st['held'] is None:
+                stored.append(st['held'])
+            self.series[key] = { 'anchor': rec, 'held': None, 'doors': {} }
+            stored.append(rec)
+            return stored
+        stored = []
+        if self.openDoors(st, rec, fields) and not st['held'] is None:
+            stored.append(st['held'])
+            st['anchor'] = st['held']
+            st['doors'] = {}
+            self.openDoors(st, rec, fields)
+        elapsed = parseTime(rec['time']) - parseTime(st['anchor']['time'])
+        if (self.outOfBand(st, rec, fields) or self.othersChanged(st, rec, fields)
+                or elapsed >= self.maxInterval):
+            stored.append(rec)
+            st['anchor'] = rec
+            st['doors'] = {}
+            st['held'] = None
+        else:
+            st['held'] = rec
+        return stored
+
+class AdaptiveSchedule:
+
+    def __init__(self, minInterval, maxInterval, deviations, fixedInterval=60):
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self.fixedInterval = fixedInterval # for the series without deviation
+        self.deviations = deviations
+        self.series = {}
+
+    def changed(self, last, rec):
+        for field in numericFields(self.deviations, rec):
+            if not field in last:
+                return True
+            (dev, mode) = fieldDeviation(self.deviations, rec.get('id'), field)
+            if abs(rec[field] - last[field]) > dev:
+                return True
+        return False
+
+    def update(self, key, rec, now=None):
+        # polls faster while the value is changing, backs off while stable
+        if now is None:
+            now = time.time()
+        st = self.series.get(key)
+        if st is None:
+            st = { 'interval': self.minInterval, 'next': now, 'last': None }
+            self.series[key] = st
+        if not rec.get('done'):
+            st['next'] = now + self.minInterval
+            return
+        if len(numericFields(self.deviations, rec)) <= 0:
+            # can't tell whether it is changing
+            st['interval'] = self.fixedInterval
+        elif st['last'] is None or self.changed(st['last'], rec):
+            st['interval'] = self.minInterval
+            st['last'] = dict(rec)
+        else:
+            st['interval'] = min(st['interval'] * 2, self.maxInterval)
+        st['next'] = now + st['interval']
+        logging.debug('schedule %s interval=%d' % (key, st['interval']))
+
+    def interval(self, key):
+        if not key in self.series:
+            return self.minInterval
+        return self.series[key]['interval']
+
+    def due(self, keys, now=None):
+        if now is None:
+            now = time.time()
+        return [key for key in keys
+                if not key in self.series or self.series[key]['next'] <= now]
+
+    def nextTime(self, keys):
+        times = [self.series[key]['next'] if key in self.series else 0 for key in keys]
+        if len(times) <= 0:
+            return time.time() + self.minInterval
+        return min(times)
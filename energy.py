@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Incremental energy accounting per appliance (BTWATTCH2) reconciled
+# against the smart meter.
+#
+import os
+import json
+import datetime
+import logging
+import compress
+
+class EnergyAccount:
+
+    # The compressed records of a stable series are STORE_INTERVAL apart
+    # plus the polling interval, which must not be taken as a gap.
+    def __init__(self, maxGap=compress.STORE_INTERVAL * 2):
+        self.maxGap = maxGap # seconds, longer interval is not integrated
+        self.now = None      # latest sample time
+        self.meter = self.newSeries()
+        self.counter = self.newSeries()
+        self.counter['counter'] = True
+        self.counter['offset'] = 0
+        self.counter['unit'] = 1.0
+        self.counter['digits'] = None
+        self.plugs = {}
+        self.offsets = {}    # read positions of the record files
+        self.base = None     # counter and appliance totals the kWh start from
+
+    def newSeries(self):
+        return {
+            'wh': 0.0,      # integrated up to last
+            'last': None,   # [time, value]
+            'prev': None,   # [time, value], None at the start of a segment
+            'gap': 0.0,     # seconds not integrated
+            'failed': 0,    # number of failed reads
+            # value at the latest sample time of each other series,
+            # [time, value], or the time while waiting for the next sample.
+            'at': {},
+            'pending': {}
+        }
+
+    def load(self, fname):
+        if not os.path.exists(fname):
+            return
+        try:
+            with open(fname, 'r') as fd:
+                st = json.load(fd)
+        except ValueError as e:
+            logging.error('energy state broken, %s' % (e))
+            return
+        self.now = st['now']
+        self.meter = st['meter']
+        self.counter = st['counter']
+        self.plugs = st['plugs']
+        self.offsets = st['offsets']
+        self.base = st.get('base')
+        for st in self.series().values():
+            st.setdefault('at', {})
+            st.setdefault('pending', {})
+
+    def save(self, fname):
+        with open(fname, 'w') as fd:
+            json.dump({
+                'now': self.now,
+                'meter': self.meter,
+                'counter': self.counter,
+                'plugs': self.plugs,
+                'offsets': self.offsets,
+                'base': self.base
+            }, fd)
+
+    def series(self):
+        o = {
+            'meter': self.meter,
+            'counter': self.counter
+        }
+        o.update(self.plugs)
+        return o
+
+    def tick(self, t):
+        if self.now is None or t > self.now:
+            self.now = t
+
+    def integrate(self, st, t, w):
+        # trapezoidal integration over the actual sample timestamps,
+        # returns False if the sample is not taken.
+        last = st['last']
+        if last is None:
+            st['last'] = [t, w]
+            return True
+        dt = t - last[0]
+        if dt <= 0:
+            return False
+        if dt > self.maxGap:
+            st['gap'] += dt
+            st['prev'] = None
+            st['last'] = [t, w]
+            return True
+        st['wh'] += (last[1] + w) / 2.0 * dt / 3600.0
+        st['prev'] = last
+        st['last'] = [t, w]
+        return True
+
+    def valueAt(self, st, t):
+        # energy (or counter value) at t, None if the samples around t
+        # are not kept any more.
+        last = st['last']
+        prev = st['prev']
+        if st.get('counter'):
+            if last is None or (prev is None and t < last[0]):
+                return None
+            if t >= last[0]:
+                return last[1]
+            if t < prev[0]:
+                return None
+            return prev[1] + (last[1] - prev[1]) * (t - prev[0]) / (last[0] - prev[0])
+        if last is None:
+            return 0.0
+        if t >= last[0]:
+            return st['wh']
+        if prev is None:
+            # t is in a gap, nothing was integrated since then
+            return st['wh']
+        if t < prev[0]:
+            return None
+        r = (t - prev[0]) / (last[0] - prev[0])
+        w = prev[1] + (last[1] - prev[1]) * r
+        return st['wh'] - (w + last[1]) / 2.0 * (last[0] - t) / 3600.0
+
+    def snapshot(self, name, t):
+        # Records the value of the other series at t, the time of the new
+        # sample of name, so that they can be aligned at t later however
+        # many samples they get since. The series not sampled until t
+        # yet take it when their next sample arrives.
+        for (other, st) in self.series().items():
+            if other == name:
+                continue
+            if not st['last'] is None and st['last'][0] >= t:
+                st['at'][name] = [t, self.valueAt(st, t)]
+                st['pending'].pop(name, None)
+            else:
+                st['at'].pop(name, None)
+                st['pending'][name] = t
+
+    def resolve(self, st):
+        # takes the values requested by snapshot() within the new segment
+        for (name, t) in list(st['pending'].items()):
+            if t <= st['last'][0]:
+                st['at'][name] = [t, self.valueAt(st, t)]
+                del st['pending'][name]
+
+    def alignedAt(self, name, st, t):
+        # value of st at t, the latest sample time of name
+        value = self.valueAt(st, t)
+        if value is None:
+            at = st['at'].get(name)
+            if not at is None and at[0] == t:
+                value = at[1]
+        return value
+
+    def addCounter(self, t, kwh):
+        st = self.counter
+        kwh = kwh * st['unit'] + st['offset']
+        last = st['last']
+        if not last is None:
+            if t <= last[0]:
+                return
+            if kwh < last[1]:
+                span = None
+                if st.get('digits') is not None:
+                    span = 10 ** st['digits'] * st['unit']
+                if span is not None and kwh + span - last[1] < span / 2:
+                    # wrapped around
+                    logging.info('kwh counter wrapped %f -> %f' % (last[1], kwh))
+                    st['offset'] += span
+                    kwh += span
+                else:
+                    logging.warning('kwh counter reset %f -> %f' % (last[1], kwh))
+                    st['offset'] += last[1] - kwh
+                    kwh = last[1]
+            st['prev'] = last
+        st['last'] = [t, kwh]
+        self.resolve(st)
+
+    def addMeter(self, rec):
+        if rec.get('type', 'power') != 'power':
+            return
+        if not rec.get('done'):
+            self.meter['failed'] += 1
+            return
+        if rec.get('kwh_unit') is not None:
+            self.counter['unit'] = rec['kwh_unit']
+        if rec.get('kwh_digits') is not None:
+            self.counter['digits'] = rec['kwh_digits']
+        if rec.get('fixed_kwh') is not None:
+            t = compress.parseTime(rec['fixed_time'])
+            self.addCounter(t, rec['fixed_kwh'])
+        t = compress.parseTime(rec.get('time'))
+        self.tick(t)
+        if rec.get('kwh') is not None:
+            self.addCounter(t, rec['kwh'])
+        if 'w' in rec and self.integrate(self.meter, t, rec['w']):
+            self.resolve(self.meter)
+            self.snapshot('meter', t)
+
+    def addPlug(self, rec):
+        mac = rec.get('mac', '').lower()
+        st = self.plugs.get(mac)
+        if st is None:
+            st = self.newSeries()
+            self.plugs[mac] = st
+        st['id'] = rec.get('id')
+        if not rec.get('done') or not 'w' in rec:
+            st['failed'] += 1
+            return
+        t = compress.parseTime(rec.get('time'))
+        self.tick(t)
+        if self.integrate(st, t, rec['w']):
+            self.resolve(st)
+            self.snapshot(mac, t)
+
+    def watermark(self):
+        # (name, time) of the latest time every active series has been
+        # sampled until
+        if self.meter['last'] is None:
+            return (None, None)
+        series = [('meter', self.meter)] + list(self.plugs.items())
+        times = [(st['last'][0], name) for (name, st) in series
+                 if not st['last'] is None and st['last'][0] >= self.now - self.maxGap]
+        if len(times) <= 0:
+            return ('meter', self.meter['last'][0])
+        (t, name) = min(times)
+        return (name, t)
+
+    def alignedWh(self, name, st, t):
+        wh = self.alignedAt(name, st, t)
+        if wh is None:
+            # samples around t lost, eg. the state of an older version
+            logging.warning('no energy at watermark, latest used')
+            wh = st['wh']
+        return wh
+
+    def reconcile(self):
+        # returns the totals aligned at the watermark
+        (name, t) = self.watermark()
+        if t is None:
+            return None
+        meterWh = self.alignedWh(name, self.meter, t)
+        appliances = {}
+        total = 0.0
+        for (mac, st) in self.plugs.items():
+            wh = self.alignedWh(name, st, t)
+            total += wh
+            appliances[mac] = {
+                'id': st.get('id'),
+                'wh': wh,
+                'gap': st['gap'],
+                'failed': st['failed']
+            }
+        o = {
+            'time': datetime.datetime.fromtimestamp(t).strftime('%Y/%m/%d %H:%M:%S'),
+            'meter_wh': meterWh,
+            'appliance_wh': total,
+            'remainder_wh': meterWh - total,
+            'meter_gap': self.meter['gap'],
+            'appliances': appliances
+        }
+        kwh = self.alignedAt(name, self.counter, t)
+        if not kwh is None:
+            # the counter and the appliances are compared from the same
+            # reconciled time, the first one the counter is known at.
+            if self.base is None:
+                self.base = { 'time': t, 'kwh': kwh, 'wh': total }
+            kwh -= self.base['kwh']
+            o['meter_kwh'] = kwh
+            o['remainder_kwh'] = kwh - (total - self.base['wh']) / 1000.0
+            o['kwh_since'] = datetime.datetime.fromtimestamp(self.base['time']).strftime('%Y/%m/%d %H:%M:%S')
+        return o
@@ -20,6 +20,16 @@ class HEMS:
     GET_PREFIX += b'\x02\x88\x01' # DEOJ, low voltage smart power meter class
     GET_PREFIX += b'\x62'         # ESV,  property read request
 
+    ESV_GET_RES = '72' # property read response
+    ESV_INF     = '73' # property notification
+    ESV_INFC    = '74' # property notification (response required)
+
+    # E1: unit for cumulative amounts of electric energy (kWh)
+    KWH_UNIT = {
+        0x00: 1.0,    0x01: 0.1,     0x02: 0.01,  0x03: 0.001, 0x04: 0.0001,
+        0x0A: 10.0,   0x0B: 100.0,   0x0C: 1000.0, 0x0D: 10000.0
+    }
+
     def __init__(self, rbid, rbpwd):
         self.rbid = rbid # B-Route authentication ID
         self.rbpwd = rbpwd # B-Route authentication password
@@ -53,6 +63,21 @@ class HEMS:
         logging.debug('requestGetProperty %s' % (command))
         self.ser.write(command)
 
+    def sendInfcRes(self, o):
+        msg  = b'\x10\x81'
+        msg += bytes.fromhex(o['TID'])
+        msg += b'\x05\xFF\x01'
+        msg += bytes.fromhex(o['SEOJ'])
+        msg += b'\x7A' # ESV, property notification response
+        msg += bytes([len(o['PROPS'])])
+        for epc in o['PROPS'].keys():
+            msg += bytes.fromhex(epc)
+            msg += b'\x00'
+        command = "SKSENDTO 1 {0} 0E1A 1 {1:04X} ".format(self.ipv6Addr, len(msg))
+        command = command.encode() + msg
+        logging.debug('sendInfcRes %s' % (command))
+        self.ser.write(command)
+
     def sendCredential(self):
         self.writeSerial("SKSETPWD C " + self.rbpwd + "\r\n")
         self.waitOk()
@@ -146,32 +171,138 @@ class HEMS:
             offset += (pdc * 2)
         return o
 
+    def readFrame(self):
+        # returns decoded ECHONET Lite frame of the next ERXUDP,
+        # or None on read timeout.
+        # Other frames (eg. MLE on port 4D4C) are skipped.
+        while True:
+            line = self.readSer().decode()
+            if len(line) <= 0:
+                return None
+            if not line.startswith("ERXUDP"):
+                continue
+            cols = line.strip().split(' ')
+            if len(cols) < 9 or cols[4] != '0E1A': # local port, ECHONET Lite
+                logging.debug('skip non ECHONET Lite frame %s' % (line))
+                continue
+            res = cols[8]   # UDP data part
+            if not res.startswith('1081'): # EHD
+                logging.debug('skip non ECHONET Lite frame %s' % (line))
+                continue
+            try:
+                return self.decodeMsg(res)
+            except (ValueError, IndexError) as e:
+                logging.warning('broken frame %s, %s' % (line.strip(), e))
+
+    def decodeFixedTime(self, edt):
+        # EA/EB: YYYY MM DD hh mm ss (7 bytes) + cumulative energy (4 bytes)
+        ts = '%04d/%02d/%02d %02d:%02d:%02d' % (
+            int(edt[0:4], 16), int(edt[4:6], 16), int(edt[6:8], 16),
+            int(edt[8:10], 16), int(edt[10:12], 16), int(edt[12:14], 16))
+        value = int(edt[14:22], 16)
+        if value == 0xFFFFFFFE: # no data
+            value = None
+        return (ts, value)
+
+    def decodeProps(self, o, data):
+        for (epc, prop) in o['PROPS'].items():
+            edt = prop['EDT']
+            if epc == 'D7':
+                # number of digits of the cumulative energy counter
+                data['kwh_digits'] = int(edt, 16)
+            elif epc == 'E0':
+                data['kwh'] = int(edt, 16)
+            elif epc == 'E1':
+                data['kwh_unit'] = self.KWH_UNIT.get(int(edt, 16))
+            elif epc == 'E7':
+                data['w'] = int(edt, 16)
+            elif epc == 'E8':
+                t = int(edt[0:4], 16) / 10.0
+                r = int(edt[4:8], 16) / 10.0
+                data['a_t'] = t
+                data['a_r'] = r
+            elif epc == 'EA':
+                (ts, value) = self.decodeFixedTime(edt)
+                data['fixed_kwh'] = value
+                data['fixed_time'] = ts
+            elif epc == 'EB':
+                (ts, value) = self.decodeFixedTime(edt)
+                data['fixed_kwh_r'] = value
+                data['fixed_time_r'] = ts
+            elif epc == 'D5':
+                # instance list notification, 1 byte count + 3 bytes per EOJ
+                n = int(edt[0:2], 16)
+                data['instances'] = [edt[2+i*6:8+i*6] for i in range(0, n)]
+        return data
+
     def getData(self):
         data = {
             'mac': self.mac
         }
         self.requestGetProperty((0xD7, 0xE0, 0xE1, 0xE7, 0xE8, 0xEA))
         while True:
-            line = self.readSer().decode()
-            if len(line) <= 0:
+            o = self.readFrame()
+            if o is None:
                 logging.error('read TIMEOUT\n')
                 return None
-            if line.startswith("ERXUDP"):
+            if o['SEOJ'] == '028801' and o['ESV'] == self.ESV_GET_RES:
                 break
-        cols = line.strip().split(' ')
-        res = cols[8]   # UDP data part
-        o = self.decodeMsg(res)
-
-        if o['SEOJ'] == '028801' and o['ESV'] == "72":
-            for (epc, prop) in o['PROPS'].items():
-                edt = prop['EDT']
-                if epc == 'E0':
-                    data['kwh'] = int(edt, 16)
-                elif epc == 'E7':
-                    data['w'] = int(edt, 16)
-                elif epc == 'E8':
-                    t = int(edt[0:4], 16) / 10.0
-                    r = int(edt[4:8], 16) / 10.0
-                    data['a_t'] = t
-                    data['a_r'] = r
-        return data
+            logging.debug('skip ESV=%s SEOJ=%s' % (o['ESV'], o['SEOJ']))
+        return self.decodeProps(o, data)
+
+    def listen(self, callback, pollProps=(0xE7, 0xE8), pollInterval=60, duration=None):
+        # Records unsolicited INF notifications (30 minute fixed time
+        # cumulative energy, instance list) as they arrive, and polls
+        # only the properties the meter doesn't push.
+        # callback(data) is called for each decoded frame.
+        # pollInterval may be a function returning the current interval.
+        # Returns False when the link seems lost, True when duration passed.
+        start = time.time()
+        lastPoll = None
+        lastRecv = start
+        while duration is None or time.time() - start < duration:
+            if callable(pollInterval):
+                interval = pollInterval()
+            else:
+                interval = pollInterval
+            if len(pollProps) > 0:
+                recvLimit = interval * 3
+            else:
+                recvLimit = 1800 * 3
+            now = time.time()
+            if lastPoll is None:
+                # the digits and unit of cumulative energy, once
+                self.requestGetProperty(tuple(pollProps) + (0xD7, 0xE1))
+                lastPoll = now
+            elif len(pollProps) > 0 and now - lastPoll >= interval:
+                self.requestGetProperty(pollProps)
+                lastPoll = now
+            o = self.readFrame()
+            if o is None:
+                if time.time() - lastRecv > recvLimit:
+                    logging.error('no frame received, link lost?')
+                    return False
+                continue
+            lastRecv = time.time()
+            if o['ESV'] not in (self.ESV_GET_RES, self.ESV_INF, self.ESV_INFC):
+                logging.debug('skip ESV=%s SEOJ=%s' % (o['ESV'], o['SEOJ']))
+                continue
+            if o['SEOJ'] != '028801' and o['SEOJ'] != '0EF001':
+                continue
+            if o['ESV'] == self.ESV_INFC:
+                self.sendInfcRes(o)
+            data = {
+                'mac': self.mac
+            }
+            if o['ESV'] != self.ESV_GET_RES:
+                data['inf'] = True
+            if o['SEOJ'] == '0EF001':
+                # node profile, eg. instance list, not a power reading
+                data['type'] = 'node_profile'
+            try:
+                self.decodeProps(o, data)
+            except (ValueError, IndexError) as e:
+                logging.warning('broken properties %s, %s' % (o['PROPS'], e))
+                continue
+            callback(data)
+        return True
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Last value cache of the recorded data, served over local HTTP.
+#
+#   GET  /latest                 latest record of every (id, type)
+#   GET  /latest/<id>/<type>     latest record of (id, type)
+#   GET  /recent/<id>/<type>     recent records of (id, type)
+#   GET  /wait?seq=N[&id=..&type=..][&timeout=30]
+#                                waits for the records updated after seq N
+#   POST /record                 adds a record or a list of records
+#
+import sys
+import json
+import math
+import time
+import logging
+import threading
+import collections
+import urllib.parse
+import urllib.request
+import http.server
+
+HOST = '127.0.0.1'
+PORT = 8780
+
+class LastValueCache:
+
+    def __init__(self, window=60):
+        self.window = window # number of recent records kept per (id, type)
+        self.cond = threading.Condition()
+        self.seq = 0
+        self.latest = {}
+        self.recent = {}
+
+    def put(self, rec):
+        if not rec.get('done'):
+            return False
+        key = (rec.get('id'), rec.get('type'))
+        with self.cond:
+            self.seq += 1
+            rec = dict(rec)
+            rec['seq'] = self.seq
+            # partial records (eg. EA notification without w) update
+            # their fields only, the others are kept. Notifications carry
+            # their own time (eg. fixed_time) and keep the time of the
+            # polled fields.
+            latest = dict(self.latest.get(key, {}))
+            latest.pop('inf', None) # flag of the previous record
+            polled = latest.get('time')
+            latest.update(rec)
+            if rec.get('inf') and not polled is None:
+                latest['time'] = polled
+            self.latest[key] = latest
+            if not key in self.recent:
+                self.recent[key] = collections.deque(maxlen=self.window)
+            self.recent[key].append(rec)
+            self.cond.notify_all()
+        return True
+
+    def get(self, id, type):
+        return self.latest.get((id, type))
+
+    def getAll(self):
+        with self.cond:
+            return list(self.latest.values())
+
+    def getRecent(self, id, type):
+        with self.cond:
+            return list(self.recent.get((id, type), []))
+
+    def updated(self, seq, id=None, type=None):
+        if not id is None:
+            rec = self.latest.get((id, type))
+            if rec is None or rec['seq'] <= seq:
+                return []
+            return [rec]
+        if self.seq <= seq:
+            return []
+        return [rec for rec in self.latest.values() if rec['seq'] > seq]
+
+    def wait(self, seq, id=None, type=None, timeout=30):
+        # long-poll, returns the records updated after seq, or [] on timeout
+        end = time.time() + timeout
+        with self.cond:
+            while True:
+                recs = self.updated(seq, id, type)
+                remaining = end - time.time()
+                if len(recs) > 0 or remaining <= 0:
+                    return (self.seq, recs)
+                self.cond.wait(remaining)
+
+class Handler(http.server.BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    def reply(self, code, o):
+        body = json.dumps(o).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        cache = self.server.cache
+        url = urllib.parse.urlparse(self.path)
+        args = url.path.strip('/').split('/')
+        if args == ['latest']:
+            self.reply(200, cache.getAll())
+        elif len(args) == 3 and args[0] == 'latest':
+            rec = cache.get(args[1], args[2])
+            if rec is None:
+                self.reply(404, {'error': 'not found'})
+            else:
+                self.reply(200, rec)
+        elif len(args) == 3 and args[0] == 'recent':
+            self.reply(200, cache.getRecent(args[1], args[2]))
+        elif args == ['wait']:
+            query = urllib.parse.parse_qs(url.query)
+            try:
+                seq = int(query.get('seq', ['0'])[0])
+                timeout = float(query.get('timeout', ['30'])[0])
+                if not math.isfinite(timeout):
+                    raise ValueError('timeout %s' % (timeout))
+            except ValueError:
+                self.reply(400, {'error': 'bad parameter'})
+                return
+            timeout = max(0, min(timeout, 300))
+            id = query.get('id', [None])[0]
+            type = query.get('type', [None])[0]
+            if (id is None) != (type is None):
+                self.reply(400, {'error': 'give both id and type'})
+                return
+            (seq, recs) = cache.wait(seq, id, type, timeout)
+            self.reply(200, {'seq': seq, 'records': recs})
+        else:
+            self.reply(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/record':
+            self.reply(404, {'error': 'not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.reply(400, {'error': 'bad Content-Length'})
+            return
+        try:
+            o = json.loads(self.rfile.read(length))
+        except ValueError:
+            self.reply(400, {'error': 'bad json'})
+            return
+        if not isinstance(o, list):
+            o = [o]
+        n = 0
+        for rec in o:
+            if isinstance(rec, dict) and self.server.cache.put(rec):
+                n += 1
+        self.reply(200, {'stored': n})
+
+def makeServer(host=HOST, port=PORT, window=60):
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.cache = LastValueCache(window)
+    return server
+
+def serve(host=HOST, port=PORT, window=60):
+    makeServer(host, port, window).serve_forever()
+
+def publish(recs, host=HOST, port=PORT):
+    # called from the recording scripts, never fails them
+    body = json.dumps(recs).encode()
+    req = urllib.request.Request('http://%s:%d/record' % (host, port), data=body,
+                                 headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req, timeout=1.0) as res:
+            res.read()
+    except OSError as e:
+        logging.debug('publish failed, %s' % (e))
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO,
+                        format='[%(asctime)s %(levelname)s %(message)s')
+    port = PORT
+    if len(sys.argv) > 1:
+        port = int(sys.argv[1])
+    serve(port=port)
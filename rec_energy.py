@@ -0,0 +1,79 @@
+import energy
+import compress
+import lvc
+import sys
+import os
+import time
+import json
+import heapq
+import logging
+
+def readNew(fname, offsets):
+    # yields (time, fname, record, offset) of the lines appended since
+    # the last run, only complete lines.
+    if not os.path.exists(fname):
+        return
+    offset = offsets.get(fname, 0)
+    if os.path.getsize(fname) < offset:
+        # rotated
+        offset = 0
+    t = 0
+    with open(fname, 'r') as fd:
+        fd.seek(offset)
+        while True:
+            line = fd.readline()
+            if not line.endswith('\n'):
+                break
+            offset = fd.tell()
+            try:
+                o = json.loads(line)
+            except ValueError:
+                logging.warning('broken line in %s' % (fname))
+                continue
+            if 'time' in o:
+                # failed reads without time keep the order
+                t = compress.parseTime(o['time'])
+            yield (t, fname, o, offset)
+
+def process():
+    account = energy.EnergyAccount()
+    account.load(stateFile)
+    offsets = account.offsets
+    streams = [readNew(meterFile, offsets), readNew(wattFile, offsets)]
+    n = 0
+    for (t, fname, o, offset) in heapq.merge(*streams, key=lambda x: x[0]):
+        if fname == meterFile:
+            account.addMeter(o)
+        else:
+            account.addPlug(o)
+        offsets[fname] = offset
+        n += 1
+    if n <= 0:
+        return
+    data = account.reconcile()
+    account.save(stateFile)
+    if data is None:
+        return
+    data['id'] = 'energy'
+    data['type'] = 'energy'
+    data['done'] = True
+    with open(recFile, 'a') as fd:
+        fd.write(json.dumps(data) + '\n')
+    lvc.publish([data])
+
+meterFile = 'power_meter_rec.dat'
+wattFile = 'watt_rec.dat'
+recFile = 'energy_rec.dat'
+stateFile = 'energy_state.dat'
+logFile = '/var/log/energy.log'
+
+logging.basicConfig(level=logging.INFO,
+                    filename=logFile,
+                    format='[%(asctime)s %(levelname)s %(message)s')
+
+if len(sys.argv) > 1 and sys.argv[1] == 'loop':
+    while True:
+        process()
+        time.sleep(60)
+
+process()
@@ -1,7 +1,10 @@
 import hems
+import compress
+import lvc
 import sys
 import datetime
 import json
+import time
 import logging
 
 def readConf(fname):
@@ -33,14 +36,20 @@ def timestamp():
 
 def recordData(fname, data):
     data['id'] = 'tepco'
-    data['type'] = 'power'
+    if not 'type' in data:
+        data['type'] = 'power'
     data['time'] = timestamp()
     #print(data)
     with open(fname, 'a') as fd:
-        fd.write(json.dumps(data) + '\n')
+        for rec in compressor.add(data):
+            fd.write(json.dumps(rec) + '\n')
+    compressor.save(stateFile)
+    lvc.publish([data])
 
 confFile = '/etc/home_iot/hems.conf'
 recFile = 'power_meter_rec.dat'
+compressConf = 'compress_list.dat'
+stateFile = 'power_meter_state.dat'
 logFile = '/var/log/hems.log'
 
 logging.basicConfig(level=logging.INFO,
@@ -49,6 +58,35 @@ logging.basicConfig(level=logging.INFO,
 
 (rbid, rbpwd) = readConf(confFile)
 
+deviations = compress.readConf(compressConf)
+compressor = compress.Compressor(deviations)
+compressor.load(stateFile)
+
+# polls instantaneous power every 10 seconds to 5 minutes depending on
+# how much it is changing.
+schedule = compress.AdaptiveSchedule(10, 300, deviations)
+
+def recordListened(data):
+    data['done'] = True
+    recordData(recFile, data)
+    if not data.get('inf'):
+        schedule.update('tepco', data)
+
+if len(sys.argv) > 1 and sys.argv[1] == 'listen':
+    # keep connected and record notifications pushed by the meter,
+    # polling only instantaneous power and current.
+    while True:
+        dev = hems.HEMS(rbid, rbpwd)
+        if dev.connect():
+            dev.listen(recordListened, pollProps=(0xE7, 0xE8),
+                       pollInterval=lambda: schedule.interval('tepco'))
+        else:
+            recordData(recFile, { 'error': 'connect failed',
+                                  'done': False
+            })
+        dev.ser.close()
+        time.sleep(10)
+
 data = None
 dev = hems.HEMS(rbid, rbpwd)
 if dev.connect():
@@ -1,5 +1,9 @@
 import switchbot_thm
+import compress
+import lvc
+import sys
 import json
+import time
 import logging
 
 def readConf(conf):
@@ -24,10 +28,15 @@ def recordData(fname, data):
     with open(fname, 'a') as fd:
         for (mac, o) in data.items():
             o['mac'] = mac
-            fd.write(json.dumps(o) + '\n')
+            for rec in compressor.add(o):
+                fd.write(json.dumps(rec) + '\n')
+    compressor.save(stateFile)
+    lvc.publish(list(data.values()))
 
 confFile = 'thm_list.dat'
 recFile = 'thm_rec.dat'
+compressConf = 'compress_list.dat'
+stateFile = 'thm_state.dat'
 logFile = '/var/log/thm.log'
 
 logging.basicConfig(level=logging.INFO,
@@ -35,8 +44,31 @@ logging.basicConfig(level=logging.INFO,
                     format='[%(asctime)s %(levelname)s %(message)s')
 
 
-targets = readConf(confFile)
+deviations = compress.readConf(compressConf)
+compressor = compress.Compressor(deviations)
+compressor.load(stateFile)
+
 dev = switchbot_thm.Device()
+
+if len(sys.argv) > 1 and sys.argv[1] == 'loop':
+    # scans each thermometer every 1 to 10 minutes depending on
+    # how much its values are changing.
+    schedule = compress.AdaptiveSchedule(60, 600, deviations)
+    while True:
+        targets = readConf(confFile)
+        macs = schedule.due(targets.keys())
+        if len(macs) > 0:
+            results = dev.getData(macs, 30)
+            data = {}
+            for mac in macs:
+                if mac in results:
+                    targets[mac].update(results[mac])
+                schedule.update(mac, targets[mac])
+                data[mac] = targets[mac]
+            recordData(recFile, data)
+        time.sleep(max(1, schedule.nextTime(targets.keys()) - time.time()))
+
+targets = readConf(confFile)
 results = dev.getData(targets.keys(), 30)
 for mac in targets.keys():
     if mac in results:
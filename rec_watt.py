@@ -1,6 +1,9 @@
 import btwattch2
+import compress
+import lvc
 import sys
 import json
+import time
 import logging
 
 def readConf(conf):
@@ -25,24 +28,54 @@ def recordData(fname, data):
     with open(fname, 'a') as fd:
         for (mac, o) in data.items():
             o['mac'] = mac
-            fd.write(json.dumps(o) + '\n')
+            for rec in compressor.add(o):
+                fd.write(json.dumps(rec) + '\n')
+    compressor.save(stateFile)
+    lvc.publish(list(data.values()))
 
 confFile = 'watt_list.dat'
 recFile = 'watt_rec.dat'
+compressConf = 'compress_list.dat'
+stateFile = 'watt_state.dat'
 logFile = '/var/log/watt.log'
 
 logging.basicConfig(level=logging.INFO,
                     filename=logFile,
                     format='[%(asctime)s %(levelname)s %(message)s')
 
-targets = readConf(confFile)
-for mac in targets.keys():
+def readWatt(mac, target):
     wattChecker = btwattch2.BTWATTChecker(mac)
     if not wattChecker.scanAndConnect():
-        continue
+        return
     wattChecker.monitor()
     data = wattChecker.get_rec_data()
     wattChecker.disconnect()
-    targets[mac].update(data)
-    logging.debug(targets[mac])
+    for name in ('id', 'type'):
+        data.pop(name, None) # keep the ones in watt_list.dat
+    target.update(data)
+    logging.debug(target)
+
+deviations = compress.readConf(compressConf)
+compressor = compress.Compressor(deviations)
+compressor.load(stateFile)
+
+if len(sys.argv) > 1 and sys.argv[1] == 'loop':
+    # connects to each plug every 1 to 15 minutes depending on
+    # how much its wattage is changing.
+    schedule = compress.AdaptiveSchedule(60, 900, deviations)
+    while True:
+        targets = readConf(confFile)
+        macs = schedule.due(targets.keys())
+        data = {}
+        for mac in macs:
+            readWatt(mac, targets[mac])
+            schedule.update(mac, targets[mac])
+            data[mac] = targets[mac]
+        if len(data) > 0:
+            recordData(recFile, data)
+        time.sleep(max(1, schedule.nextTime(targets.keys()) - time.time()))
+
+targets = readConf(confFile)
+for mac in targets.keys():
+    readWatt(mac, targets[mac])
 recordData(recFile, targets)
@@ -0,0 +1,134 @@
+import os
+import random
+import unittest
+import tempfile
+import compress
+
+class TestCompressor(unittest.TestCase):
+
+    def record(self, minute, humidity, battery):
+        return {
+            'id': 'room',
+            'type': 'thm',
+            'humidity': humidity,
+            'battery': battery,
+            'done': True,
+            'time': '2026/01/01 00:%02d:00' % (minute)
+        }
+
+    def testStable(self):
+        compressor = compress.Compressor({('*', 'humidity'): (1.0, 'deadband')})
+        self.assertEqual(len(compressor.add(self.record(0, 50, 90))), 1)
+        self.assertEqual(compressor.add(self.record(1, 50, 90)), [])
+        self.assertEqual(len(compressor.add(self.record(2, 52, 90))), 1)
+
+    def testFieldWithoutDeviation(self):
+        compressor = compress.Compressor({('*', 'humidity'): (1.0, 'deadband')})
+        compressor.add(self.record(0, 50, 90))
+        stored = compressor.add(self.record(1, 50, 10))
+        self.assertEqual(len(stored), 1)
+        self.assertEqual(stored[0]['battery'], 10)
+
+    def testPlugRecord(self):
+        # idle BTWATTCH2, currents without deviation must not defeat
+        # the compression of w.
+        compressor = compress.Compressor({('*', 'w'): (2.0, 'door')})
+        n = 0
+        for i in range(0, 100):
+            w = 1.5 + (0.3 if i % 2 else -0.3)
+            n += len(compressor.add({
+                'id': 'kenji_aircon',
+                'type': 'power',
+                'mac': 'aa:bb:cc:dd:ee:ff',
+                'w': w,
+                'a_t': w / 100.0,
+                'a_r': w / 100.0,
+                'done': True,
+                'time': '2026/01/01 %02d:%02d:00' % (i // 60, i % 60)
+            }))
+        self.assertLessEqual(n, 2)
+
+    def testFieldSetChanged(self):
+        compressor = compress.Compressor({('*', 'humidity'): (1.0, 'deadband'),
+                                          ('*', 'temperature'): (0.2, 'door')})
+        compressor.add(self.record(0, 50, 90))
+        self.assertEqual(compressor.add(self.record(1, 50, 90)), [])
+        rec = self.record(2, 50, 90)
+        rec['temperature'] = 20.0
+        stored = compressor.add(rec)
+        self.assertEqual([o['time'] for o in stored],
+                         ['2026/01/01 00:01:00', '2026/01/01 00:02:00'])
+
+    def testSwingingDoor(self):
+        # the stored points reconstruct the input within the deviation
+        # by linear interpolation
+        compressor = compress.Compressor({('*', 'temperature'): (0.2, 'door')},
+                                         maxInterval=36000)
+        rand = random.Random(1)
+        records = []
+        stored = []
+        value = 20.0
+        for i in range(0, 2000):
+            if i % 300 < 150:
+                value += rand.choice((0, 0, 0, 0.1, -0.1))
+            else:
+                value += 0.03
+            rec = {
+                'id': 'room',
+                'type': 'thm',
+                'temperature': round(value, 2),
+                'done': True,
+                'time': '2026/01/%02d %02d:%02d:00' % (1 + i // 1440, i // 60 % 24, i % 60)
+            }
+            records.append(rec)
+            stored += compressor.add(rec)
+        self.assertLess(len(stored), len(records) / 10)
+        t = lambda o: compress.parseTime(o['time'])
+        j = 0
+        for (a, b) in zip(stored, stored[1:]):
+            while j < len(records) and t(records[j]) <= t(b):
+                o = records[j]
+                r = (t(o) - t(a)) / (t(b) - t(a))
+                v = a['temperature'] + (b['temperature'] - a['temperature']) * r
+                self.assertLessEqual(abs(v - o['temperature']), 0.2 + 1e-9)
+                j += 1
+        # the points after the last stored one are held
+        self.assertGreater(j, len(records) - 300)
+
+class TestReadConf(unittest.TestCase):
+
+    def testBadLines(self):
+        fname = os.path.join(tempfile.mkdtemp(), 'compress_list.dat')
+        with open(fname, 'w') as fd:
+            fd.write('# id field deviation mode\n'
+                     '* temperature 0.2\n'
+                     '* humidity 1 deadband\n'
+                     '* w 2.0 deadbnd\n'
+                     'tepco w abc\n'
+                     'tepco a_t nan\n')
+        self.assertEqual(compress.readConf(fname), {
+            ('*', 'temperature'): (0.2, 'door'),
+            ('*', 'humidity'): (1.0, 'deadband')
+        })
+
+class TestAdaptiveSchedule(unittest.TestCase):
+
+    def record(self, w):
+        return { 'id': 'tepco', 'type': 'power', 'w': w, 'done': True }
+
+    def testBackOff(self):
+        schedule = compress.AdaptiveSchedule(10, 300, {('*', 'w'): (20.0, 'door')})
+        for i in range(0, 10):
+            schedule.update('tepco', self.record(500), now=i)
+        self.assertEqual(schedule.interval('tepco'), 300)
+        schedule.update('tepco', self.record(900), now=10)
+        self.assertEqual(schedule.interval('tepco'), 10)
+
+    def testWithoutDeviation(self):
+        schedule = compress.AdaptiveSchedule(10, 300, {})
+        for i in range(0, 10):
+            schedule.update('tepco', self.record(500), now=i)
+        self.assertEqual(schedule.interval('tepco'), 60)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import os
+import heapq
+import unittest
+import datetime
+import tempfile
+import compress
+import energy
+
+class TestEnergyAccount(unittest.TestCase):
+
+    def records(self, id, mac, w, hours, step):
+        base = datetime.datetime(2026, 1, 1)
+        for i in range(0, hours * 3600 + 1, step):
+            t = base + datetime.timedelta(seconds=i)
+            yield {
+                'id': id,
+                'type': 'power',
+                'mac': mac,
+                'w': w,
+                'done': True,
+                'time': t.strftime('%Y/%m/%d %H:%M:%S')
+            }
+
+    def testCompressedFlatSeries(self):
+        # a flat series is stored only once in STORE_INTERVAL after
+        # compression, it must still be integrated.
+        compressor = compress.Compressor({('*', 'w'): (2.0, 'door')})
+        account = energy.EnergyAccount()
+        stored = []
+        for rec in self.records('fridge', 'aa', 50, 3, 60):
+            stored += compressor.add(rec)
+        self.assertLess(len(stored), 10)
+        for rec in self.records('tepco', 'mm', 400, 3, 60):
+            account.addMeter(rec)
+        for rec in stored:
+            account.addPlug(rec)
+        o = account.reconcile()
+        self.assertAlmostEqual(o['appliances']['aa']['wh'], 150.0)
+        self.assertEqual(o['appliances']['aa']['gap'], 0.0)
+        self.assertAlmostEqual(o['meter_wh'], 1200.0)
+        self.assertAlmostEqual(o['remainder_wh'], 1050.0)
+
+    def variableLoad(self):
+        # two plugs with variable load sampled every 15 and 20 minutes,
+        # the meter every 10 seconds measures them + 300 W.
+        base = datetime.datetime(2026, 1, 1)
+        plugs = {
+            'aa': [(i * 900, 100 + (i * 37) % 200) for i in range(0, 24)],
+            'bb': [(i * 1200, 50 + (i * 53) % 150) for i in range(0, 18)]
+        }
+        def interp(samples, t):
+            for ((t0, w0), (t1, w1)) in zip(samples, samples[1:]):
+                if t0 <= t <= t1:
+                    return w0 + (w1 - w0) * (t - t0) / (t1 - t0)
+            return samples[-1][1]
+        def rec(mac, t, w):
+            return (t, mac, {
+                'id': mac,
+                'type': 'power',
+                'mac': mac,
+                'w': w,
+                'done': True,
+                'time': (base + datetime.timedelta(seconds=t)).strftime('%Y/%m/%d %H:%M:%S')
+            })
+        meter = [rec('tepco', t, interp(plugs['aa'], t) + interp(plugs['bb'], t) + 300)
+                 for t in range(0, 6 * 3600 + 1, 10)]
+        streams = [meter]
+        for (mac, samples) in plugs.items():
+            streams.append([rec(mac, t, w) for (t, w) in samples])
+        return list(heapq.merge(*streams, key=lambda x: x[0]))
+
+    def add(self, account, records):
+        for (t, mac, o) in records:
+            if mac == 'tepco':
+                account.addMeter(o)
+            else:
+                account.addPlug(o)
+
+    def testMismatchedRates(self):
+        # watermark is the last sample of bb at 5:40, far before the
+        # latest meter sample
+        account = energy.EnergyAccount()
+        self.add(account, self.variableLoad())
+        o = account.reconcile()
+        self.assertEqual(o['time'], '2026/01/01 05:40:00')
+        self.assertAlmostEqual(o['remainder_wh'], 300 * (5 + 40 / 60.0))
+
+    def testMismatchedRatesIncremental(self):
+        records = self.variableLoad()
+        fname = os.path.join(tempfile.mkdtemp(), 'energy_state.dat')
+        for i in range(0, len(records), 500):
+            account = energy.EnergyAccount()
+            account.load(fname)
+            self.add(account, records[i:i + 500])
+            o = account.reconcile()
+            account.save(fname)
+            hours = (compress.parseTime(o['time']) - compress.parseTime('2026/01/01 00:00:00')) / 3600.0
+            self.assertAlmostEqual(o['remainder_wh'], 300 * hours)
+        self.assertEqual(o['time'], '2026/01/01 05:40:00')
+
+    def testCounterStartsLater(self):
+        # the counter is known from the first EA notification only, 30
+        # minutes after the meter and the plug
+        base = datetime.datetime(2026, 1, 1)
+        fmt = lambda t: (base + datetime.timedelta(seconds=t)).strftime('%Y/%m/%d %H:%M:%S')
+        account = energy.EnergyAccount()
+        for t in range(0, 3 * 3600 + 1, 60):
+            account.addMeter({'id': 'tepco', 'type': 'power', 'w': 1300,
+                              'done': True, 'time': fmt(t)})
+            account.addPlug({'id': 'tv', 'type': 'power', 'mac': 'aa', 'w': 1000,
+                             'done': True, 'time': fmt(t)})
+            if t > 0 and t % 1800 == 0:
+                account.addMeter({'id': 'tepco', 'type': 'power', 'inf': True,
+                                  'fixed_kwh': 1300 * t // 3600, 'fixed_time': fmt(t),
+                                  'kwh_unit': 0.001, 'done': True, 'time': fmt(t)})
+            if t == 3600:
+                o = account.reconcile()
+                self.assertAlmostEqual(o['meter_kwh'], 0.0)
+        o = account.reconcile()
+        self.assertEqual(o['kwh_since'], '2026/01/01 01:00:00')
+        self.assertAlmostEqual(o['meter_kwh'], 2.6)
+        self.assertAlmostEqual(o['remainder_kwh'], 0.6)
+
+    def testCounterWrap(self):
+        account = energy.EnergyAccount()
+        for (minute, kwh) in ((0, 999990), (30, 999998), (60, 5)):
+            account.addMeter({
+                'id': 'tepco',
+                'type': 'power',
+                'kwh': kwh,
+                'kwh_unit': 0.1,
+                'kwh_digits': 6,
+                'w': 1000,
+                'done': True,
+                'time': '2026/01/01 %02d:%02d:00' % (minute // 60, minute % 60)
+            })
+            o = account.reconcile()
+        self.assertAlmostEqual(o['meter_kwh'], 1.5)
+
+    def testCounterReset(self):
+        account = energy.EnergyAccount()
+        for (minute, kwh) in ((0, 500), (30, 505), (60, 3)):
+            account.addMeter({
+                'id': 'tepco',
+                'type': 'power',
+                'kwh': kwh,
+                'kwh_unit': 0.1,
+                'kwh_digits': 6,
+                'w': 1000,
+                'done': True,
+                'time': '2026/01/01 %02d:%02d:00' % (minute // 60, minute % 60)
+            })
+            o = account.reconcile()
+        self.assertAlmostEqual(o['meter_kwh'], 0.5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+import hems
+
+SENDER = 'FE80:0000:0000:0000:021C:6400:030C:12A4'
+DEST = 'FE80:0000:0000:0000:021D:1290:1234:5678'
+
+def erxudp(data, rport='0E1A', lport='0E1A'):
+    return ('ERXUDP %s %s %s %s 001C6400030C12A4 1 %04X %s\r\n'
+            % (SENDER, DEST, rport, lport, len(data) // 2, data)).encode()
+
+class Serial:
+
+    def __init__(self):
+        self.written = []
+
+    def write(self, msg):
+        self.written.append(msg)
+
+class TestHEMS(unittest.TestCase):
+
+    def setUp(self):
+        # without opening the serial port
+        self.dev = hems.HEMS.__new__(hems.HEMS)
+        self.dev.mac = '001C6400030C12A4'
+        self.dev.ipv6Addr = SENDER
+        self.dev.ser = Serial()
+        self.lines = []
+        self.dev.readSer = lambda: self.lines.pop(0) if len(self.lines) > 0 else b''
+
+    def listen(self):
+        recs = []
+        self.dev.listen(recs.append, pollInterval=60, duration=0.2)
+        return recs
+
+    def testSkipMLE(self):
+        self.lines = [
+            erxudp('00000000ABCDEF', rport='4D4C', lport='4D4C'),
+            erxudp('108100'), # broken
+            erxudp('1081000102880105FF017201E704000001F4')
+        ]
+        o = self.dev.readFrame()
+        self.assertEqual(o['ESV'], '72')
+        self.assertEqual(self.dev.decodeProps(o, {}), {'w': 500})
+        self.assertIsNone(self.dev.readFrame())
+
+    def testGetResponse(self):
+        self.lines = [erxudp('1081000102880105FF0172'
+                             + '04'
+                             + 'D70106'
+                             + 'E10101'
+                             + 'E804001E0005'
+                             + 'E00400012345')]
+        o = self.dev.readFrame()
+        self.assertEqual(self.dev.decodeProps(o, {}), {
+            'kwh_digits': 6,
+            'kwh_unit': 0.1,
+            'a_t': 3.0,
+            'a_r': 0.5,
+            'kwh': 0x12345
+        })
+
+    def testFixedTimeNotification(self):
+        self.lines = [erxudp('1081000102880105FF0173' + '01'
+                             + 'EA0B' + '07EA0101' + '0E1E00' + '00001234')]
+        recs = self.listen()
+        self.assertEqual(recs, [{
+            'mac': self.dev.mac,
+            'inf': True,
+            'fixed_kwh': 0x1234,
+            'fixed_time': '2026/01/01 14:30:00'
+        }])
+
+    def testNotificationResponse(self):
+        self.lines = [erxudp('1081ABCD02880105FF0174' + '01'
+                             + 'EA0B' + '07EA0101' + '0E1E00' + 'FFFFFFFE')]
+        recs = self.listen()
+        self.assertIsNone(recs[0]['fixed_kwh'])
+        res = [msg for msg in self.dev.ser.written if msg.endswith(b'\x7A\x01\xEA\x00')]
+        self.assertEqual(len(res), 1)
+        self.assertIn(b'\x10\x81\xAB\xCD\x05\xFF\x01\x02\x88\x01', res[0])
+
+    def testInstanceList(self):
+        self.lines = [erxudp('108100010EF0010EF00173' + '01' + 'D504' + '01028801')]
+        recs = self.listen()
+        self.assertEqual(recs[0]['type'], 'node_profile')
+        self.assertEqual(recs[0]['instances'], ['028801'])
+
+if __name__ == '__main__':
+    unittest.main()
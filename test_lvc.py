@@ -0,0 +1,97 @@
+import json
+import time
+import unittest
+import threading
+import http.client
+import lvc
+
+class TestLastValueCache(unittest.TestCase):
+
+    def testMerge(self):
+        cache = lvc.LastValueCache()
+        cache.put({'id': 'tepco', 'type': 'power', 'w': 500, 'done': True,
+                   'time': '2026/01/01 00:00:00'})
+        cache.put({'id': 'tepco', 'type': 'power', 'fixed_kwh': 1234,
+                   'fixed_time': '2026/01/01 00:00:00',
+                   'inf': True, 'done': True, 'time': '2026/01/01 00:04:00'})
+        rec = cache.get('tepco', 'power')
+        self.assertEqual(rec['w'], 500)
+        self.assertEqual(rec['time'], '2026/01/01 00:00:00')
+        self.assertEqual(rec['fixed_kwh'], 1234)
+        self.assertEqual(rec['seq'], 2)
+        cache.put({'id': 'tepco', 'type': 'power', 'w': 600, 'done': True})
+        rec = cache.get('tepco', 'power')
+        self.assertEqual(rec['w'], 600)
+        self.assertNotIn('inf', rec)
+        self.assertEqual(len(cache.getRecent('tepco', 'power')), 3)
+
+    def testFailedRead(self):
+        cache = lvc.LastValueCache()
+        self.assertFalse(cache.put({'id': 'room', 'type': 'thm', 'done': False}))
+        self.assertIsNone(cache.get('room', 'thm'))
+
+    def testWait(self):
+        cache = lvc.LastValueCache()
+        def put():
+            time.sleep(0.2)
+            cache.put({'id': 'room', 'type': 'thm', 'temperature': 21.5, 'done': True})
+        threading.Thread(target=put).start()
+        start = time.time()
+        (seq, recs) = cache.wait(0, 'room', 'thm', timeout=5)
+        self.assertLess(time.time() - start, 2)
+        self.assertEqual(seq, 1)
+        self.assertEqual(recs[0]['temperature'], 21.5)
+        # nothing newer than seq
+        start = time.time()
+        (seq, recs) = cache.wait(seq, timeout=0.3)
+        self.assertGreaterEqual(time.time() - start, 0.3)
+        self.assertEqual(recs, [])
+
+class TestServer(unittest.TestCase):
+
+    def setUp(self):
+        self.server = lvc.makeServer(port=0)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def request(self, method, path, body=None, headers={}):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=5)
+        conn.request(method, path, body, headers)
+        res = conn.getresponse()
+        o = json.loads(res.read())
+        conn.close()
+        return (res.status, o)
+
+    def testPublish(self):
+        def publish():
+            time.sleep(0.2)
+            lvc.publish([{'id': 'room', 'type': 'thm', 'temperature': 21.5, 'done': True},
+                         {'id': 'room', 'type': 'thm', 'done': False}], port=self.port)
+        threading.Thread(target=publish).start()
+        (status, o) = self.request('GET', '/wait?seq=0&id=room&type=thm&timeout=5')
+        self.assertEqual(status, 200)
+        self.assertEqual(o['records'][0]['temperature'], 21.5)
+        (status, o) = self.request('GET', '/latest/room/thm')
+        self.assertEqual((status, o['temperature']), (200, 21.5))
+        (status, o) = self.request('GET', '/recent/room/thm')
+        self.assertEqual(len(o), 1)
+        (status, o) = self.request('GET', '/latest')
+        self.assertEqual(len(o), 1)
+        (status, o) = self.request('GET', '/latest/room/none')
+        self.assertEqual(status, 404)
+
+    def testBadRequests(self):
+        for path in ('/wait?timeout=nan', '/wait?seq=x', '/wait?id=room'):
+            (status, o) = self.request('GET', path)
+            self.assertEqual(status, 400, path)
+        (status, o) = self.request('POST', '/record', 'x')
+        self.assertEqual(status, 400)
+        (status, o) = self.request('POST', '/record', '{}', {'Content-Length': 'abc'})
+        self.assertEqual(status, 400)
+
+if __name__ == '__main__':
+    unittest.main()